@@ -12,33 +12,153 @@ __version__ = "0.1.1"
 
 
 
+import atexit
 import collections.abc
-import copy
+import contextlib
+import functools
 import json
+import os
 import pathlib
-import tempfile
+import threading
+import types
+import weakref
+
+
+
+_orjson = None  # optional, much faster loading; imported on first load, False if not installed
+
+def _import_orjson():
+    global _orjson
+    if _orjson is None:
+        try:
+            import orjson
+        except ImportError:
+            orjson = False
+        _orjson = orjson
+    return _orjson
+
+
+_tempfile_flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+
+_stream_block_size = 1 << 16
+
+def _digest(b=b""):
+    import hashlib  # lazy import as only saving needs it
+    return hashlib.blake2b(b, digest_size=8)
+
+def _write_all(fd, b):
+    view = memoryview(b)
+    while view:
+        view = view[os.write(fd, view):]
+
+def _fsync_dir(path):
+    # makes a rename durable on POSIX; directories can not be opened this way on Windows
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+_scalar_types = frozenset((str, int, float, bool, type(None)))  # exact types which need no conversion
+
+
+def _inputvalue(value):
+    # JSONFileBase._inputvalue(); a module level function to spare the class attribute lookup on recursive calls
+    # exact type checks first as they are much cheaper than the isinstance() ladder; scalars of the elements are
+    # also checked inline to spare a recursive call for each of them
+    t = type(value)
+    if t in _scalar_types:
+        return value
+    elif t is dict or isinstance(value, (collections.abc.Mapping, JSONFileObject)):
+        return {
+            (k if type(k) is str else str(k)):  # ensure string keys
+            (v if type(v) in _scalar_types else _inputvalue(v))
+            for k, v in value.items()
+        }
+    elif isinstance(value, str):
+        return value
+    elif t is list or isinstance(value, (collections.abc.Sequence, JSONFileArray)):
+        return [(v if type(v) in _scalar_types else _inputvalue(v)) for v in value]
+    else:
+        return value
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_inputvalue(schema):
+    """
+    Returns a specialized version of JSONFileBase._inputvalue() for values of the given schema type. The schema can be
+    built of str, int, float, bool, None, list[...], dict[str, ...], Optional[...] or ... | None, TypedDict classes
+    and dataclasses (which describe JSON objects by their fields); anything else falls back to the generic conversion.
+    The result is always the same as of the generic conversion: values not matching the schema are converted by it.
+    """
+    import dataclasses  # lazy imports as schemas are rarely used
+    import typing
+    namespace = {"_generic": _inputvalue, "_scalar_types": _scalar_types}
+    objfuncs = {}
+    lines = []
+
+    def expr(tp, var, depth):
+        origin, args = typing.get_origin(tp), typing.get_args(tp)
+        if origin in (typing.Union, types.UnionType) and len(args) == 2 and type(None) in args:
+            (tp,) = (a for a in args if a is not type(None))
+            return expr(tp, var, depth)  # None does not match containers and falls back to the generic conversion
+        elif tp is list or origin is list:
+            x = f"x{depth}"
+            e = expr(args[0] if args else None, x, depth + 1)
+            return f"([{e} for {x} in {var}] if type({var}) is list else _generic({var}))"
+        elif (tp is dict or origin is dict) and (not args or args[0] is str):
+            k, x = f"k{depth}", f"x{depth}"
+            e = expr(args[1] if args else None, x, depth + 1)
+            return (
+                f"({{({k} if type({k}) is str else str({k})): {e} for {k}, {x} in {var}.items()}}"
+                f" if type({var}) is dict else _generic({var}))"
+            )
+        elif typing.is_typeddict(tp) or (isinstance(tp, type) and dataclasses.is_dataclass(tp)):
+            if tp not in objfuncs:
+                name = objfuncs[tp] = f"_object{len(objfuncs)}"
+                fields = typing.get_type_hints(tp)
+                body = [
+                    f"def {name}(value):",
+                    "    if type(value) is not dict:",
+                    "        return _generic(value)",
+                    "    r = {}",
+                    "    for k, x in value.items():",
+                ]
+                for i, (fieldname, fieldtype) in enumerate(fields.items()):
+                    body.append(f"        {'if' if i == 0 else 'elif'} k == {fieldname!r}:")
+                    body.append(f"            r[k] = {expr(fieldtype, 'x', depth + 1)}")
+                body.append("        else:" if fields else "        if True:")
+                body.append("            r[k if type(k) is str else str(k)] = _generic(x)")
+                body.append("    return r")
+                lines.extend(body)
+            return f"{objfuncs[tp]}({var})"
+        else:  # scalars and anything unknown
+            return f"({var} if type({var}) in _scalar_types else _generic({var}))"
+
+    lines.append(f"def _inputvalue(value):\n    return {expr(schema, 'value', 0)}")
+    exec("\n".join(lines), namespace)
+    return namespace["_inputvalue"]
 
 
 
 class JSONFileBase:
 
+    __slots__ = ()
+
     @property
     def jsonfile(self):
         return self._jsonfile
 
-    @staticmethod
-    def _inputvalue(value):
-        if isinstance(value, (collections.abc.Mapping, JSONFileObject)):
-            return {str(k): JSONFileBase._inputvalue(v) for k, v in value.items()}  # ensure string keys
-        elif isinstance(value, str):
-            return value
-        elif isinstance(value, (collections.abc.Sequence, JSONFileArray)):
-            return [JSONFileBase._inputvalue(v) for v in value]
-        else:
-            return value
+    _inputvalue = staticmethod(_inputvalue)
 
     def _outputvalue(self, data):
-        if isinstance(data, str):  # string is a special sequence
+        if type(data) in _scalar_types:
+            return data
+        elif isinstance(data, str):  # string is a special sequence
             return data
         elif isinstance(data, collections.abc.Mapping):
             return JSONFileObject(self._jsonfile, data)
@@ -51,6 +171,12 @@ class JSONFileBase:
 
 class JSONFileRoot(JSONFileBase):
 
+    __slots__ = (
+        "_jsonfile", "_data", "_lock", "_suspend_autosave", "_save_timer", "_saved_state", "_saved_len",
+        "_append_only_valid", "autosave", "autosave_delay", "_durability", "append_only", "schema", "_dump_kwargs",
+        "_encoder", "_load_kwargs", "_decoder", "_path", "__weakref__",
+    )
+
     # As the main purpose of this module to provide a human readable and version control friendly dynamic data
     # storage, I decided to diverge a little from the default JSON dump parameters.
     default_dump_kwargs = {
@@ -74,11 +200,27 @@ class JSONFileRoot(JSONFileBase):
         "object_pairs_hook": None,
     }
 
-    def __init__(self, path, *, data=..., autosave=True, dump_kwargs=None, load_kwargs=None):
+    def __init__(
+        self, path, *, data=..., autosave=True, autosave_delay=None, durability="fast", append_only=False,
+        canonical=True, schema=None, dump_kwargs=None, load_kwargs=None,
+    ):
         self._jsonfile = self
         self._data = data
+        self._lock = threading.RLock()  # held by changes and saves as delayed autosaves run in a timer thread
+        self._suspend_autosave = 0
+        self._save_timer = None
+        self._saved_state = None  # see _file_state()
+        self._saved_len = None  # length of the saved root array
+        self._append_only_valid = False  # True if the root array was only appended since the last save
         self.autosave = autosave
-        self.dump_kwargs = self.default_dump_kwargs if dump_kwargs is None else dump_kwargs
+        self.autosave_delay = autosave_delay  # seconds; None saves immediately on every change
+        self.durability = durability
+        self.append_only = append_only  # write new root array items in place of the closing bracket (not atomic)
+        self.schema = schema  # type of the data to speed up assignments to the data property
+        if dump_kwargs is None:
+            # sorting the keys is costly; canonical=False saves that for files which are not version controlled
+            dump_kwargs = self.default_dump_kwargs if canonical else dict(self.default_dump_kwargs, sort_keys=False)
+        self.dump_kwargs = dump_kwargs
         self.load_kwargs = self.default_load_kwargs if load_kwargs is None else load_kwargs
         self.path = path
         if data is ...:
@@ -94,16 +236,27 @@ class JSONFileRoot(JSONFileBase):
     def __str__(self):
         return self.__repr__()
 
-    def copy(self, path, *, autosave=..., dump_kwargs=..., load_kwargs=...):
+    def copy(
+        self, path, *, autosave=..., autosave_delay=..., durability=..., append_only=..., schema=...,
+        dump_kwargs=..., load_kwargs=...,
+    ):
         path = pathlib.Path(path)
         assert path != self.path
         autosave = autosave if autosave is not ... else self.autosave
+        autosave_delay = autosave_delay if autosave_delay is not ... else self.autosave_delay
+        durability = durability if durability is not ... else self.durability
+        append_only = append_only if append_only is not ... else self.append_only
+        schema = schema if schema is not ... else self.schema
         dump_kwargs = dump_kwargs if dump_kwargs is not ... else self.dump_kwargs
         load_kwargs = load_kwargs if load_kwargs is not ... else self.load_kwargs
         return JSONFileRoot(
             path,
             data=self._data,
             autosave=autosave,
+            autosave_delay=autosave_delay,
+            durability=durability,
+            append_only=append_only,
+            schema=schema,
             dump_kwargs=dump_kwargs,
             load_kwargs=load_kwargs,
         )
@@ -113,23 +266,77 @@ class JSONFileRoot(JSONFileBase):
         return self._outputvalue(self._data)
     @data.setter
     def data(self, value):
-        self._data = self._inputvalue(value)
-        if self.autosave:
-            self.save()
+        if isinstance(value, JSONFileContainer) and value._data is self._data:
+            return  # e.g. `jf.data += [...]` assigns back the already changed and saved data
+        with self._lock:
+            self._data = self._inputvalue(value) if self.schema is None else _compile_inputvalue(self.schema)(value)
+            self._changed()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """suspends autosaving inside the block and saves once on exit"""
+        with self._lock:
+            self._suspend_autosave += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._suspend_autosave -= 1
+                if not self._suspend_autosave and self.autosave:
+                    self.save()
 
     def delete(self):
-        self.path.unlink()
+        with self._lock:
+            self._cancel_save_timer()  # a pending delayed save would recreate the file
+            self._saved_state = None
+            self.path.unlink()
+
+    @property
+    def durability(self):
+        """either "fast" (default) or "safe" which flushes the file and its directory to disk on every save"""
+        return self._durability
+    @durability.setter
+    def durability(self, value):
+        if value not in ("fast", "safe"):
+            raise ValueError(f"durability must be 'fast' or 'safe', not {value!r}")
+        self._durability = value
+
+    @property
+    def dump_kwargs(self):
+        return types.MappingProxyType(self._dump_kwargs)  # read-only as the encoders are built in the setter
+    @dump_kwargs.setter
+    def dump_kwargs(self, value):
+        kwargs = dict(value)
+        encoder = (kwargs.pop("cls", None) or json.JSONEncoder)(**kwargs)
+        with self._lock:
+            self._dump_kwargs = dict(value)
+            self._encoder = encoder
+            self._append_only_valid = False  # the file was written with the layout of the previous encoder
+
+    def flush(self):
+        """saves immediately if a delayed autosave is pending"""
+        with self._lock:
+            if self._save_timer is not None:
+                self.save()
 
     def load(self):
         p = self.path
         path_exists = p.is_file()
         path_is_not_empty = bool(p.stat().st_size)
         if path_exists and path_is_not_empty:
-            with p.open(encoding="utf8") as f:
-                self._data = json.load(f, **self.load_kwargs)
+            self._data = self._loads(p.read_bytes())
         else:
             self._data = ...
 
+    @property
+    def load_kwargs(self):
+        return types.MappingProxyType(self._load_kwargs)  # read-only as the decoder is built in the setter
+    @load_kwargs.setter
+    def load_kwargs(self, value):
+        self._load_kwargs = dict(value)
+        kwargs = {k: v for k, v in value.items() if v is not None}
+        self._decoder = (kwargs.pop("cls", None) or json.JSONDecoder)(**kwargs)
+
     @property
     def path(self):
         return self._path
@@ -138,20 +345,157 @@ class JSONFileRoot(JSONFileBase):
         self._path = pathlib.Path(value) # ensure Path instance
 
     def save(self, *, ensure_parents=True):
+        with self._lock:
+            self._save(ensure_parents)
+
+    def _save(self, ensure_parents):
+        self._cancel_save_timer()
         p = self.path
-        s = json.dumps(self._data, **self.dump_kwargs)
-        if ensure_parents:  # ensure parent directories
-            p.parent.mkdir(parents=True, exist_ok=True)
-        with tempfile.NamedTemporaryFile("w", dir=p.parent, delete=False, encoding="utf8") as tf:
-            tf.write(s)
-            tp = p.parent / tf.name
-        tp.replace(p)
+        if self._append_only_valid and self._save_appended(p):
+            return
+        # If the file is still as we have saved it, the content is likely the same (e.g. a no-op change), so it is
+        # encoded in one piece to compare the hash before anything is written. Otherwise it is streamed.
+        saved = self._saved_state
+        b = self._dumps(self._data, stream=(saved is None or saved != self._file_state(p, saved[1])))
+        if isinstance(b, bytes):
+            if self._is_saved(p, _digest(b).digest()):
+                return
+            b = (b,)
+        tp = p.with_name(f"{p.name}.{os.getpid()}.{threading.get_ident()}.tmp")  # unique for concurrent saves
+        try:
+            fd = os.open(tp, _tempfile_flags, 0o600)
+        except FileNotFoundError:
+            if not ensure_parents:
+                raise
+            p.parent.mkdir(parents=True, exist_ok=True)  # ensure parent directories
+            fd = os.open(tp, _tempfile_flags, 0o600)
+        h = _digest()
+        try:
+            try:
+                for block in b:
+                    h.update(block)
+                    _write_all(fd, block)
+                if self.durability == "safe":
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tp, p)
+        except BaseException:
+            tp.unlink(missing_ok=True)
+            raise
+        if self.durability == "safe":
+            _fsync_dir(p.parent)
+        self._saved_state = self._file_state(p, h.digest())
+        self._set_saved_len()
+
+    def _cancel_save_timer(self):
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+            self._save_timer = None
+            _pending_saves.discard(self)
+
+    def _is_saved(self, p, digest):
+        if self._saved_state is not None and self._saved_state == self._file_state(p, digest):
+            self._set_saved_len()
+            return True  # the file is untouched since we have saved the same content
+        return False
+
+    def _save_appended(self, p):
+        # Overwrites the closing bracket of the saved root array with the new items and a new closing bracket.
+        # Returns False if this is not possible and the whole file has to be rewritten.
+        data, n = self._data, self._saved_len
+        if type(data) is not list or not n or len(data) < n:
+            return False
+        saved, state = self._saved_state, self._file_state(p, None)
+        if saved is None or state is None or saved[0] != p or saved[2:] != state[2:]:
+            return False  # other file or changed by others
+        if len(data) == n:
+            return True
+        # the layout is taken from the encoder which wrote the file; with any indent, the closing bracket of the root
+        # array is on its own line
+        closing = b"]" if self._encoder.indent is None else b"\n]"
+        separator = self._encoder.item_separator.encode("utf8")
+        b = separator + self._dumps(data[n:])[1:]  # "[" of the new items is replaced by the item separator
+        fd = os.open(p, os.O_WRONLY | getattr(os, "O_BINARY", 0))
+        try:
+            os.lseek(fd, -len(closing), os.SEEK_END)
+            _write_all(fd, b)
+            if self.durability == "safe":
+                getattr(os, "fdatasync", os.fsync)(fd)
+        finally:
+            os.close(fd)
+        self._saved_state = self._file_state(p, None)  # content hash is unknown
+        self._saved_len = len(data)
+        return True
+
+    def _set_saved_len(self):
+        self._saved_len = len(self._data) if type(self._data) is list else None
+        self._append_only_valid = self.append_only
+
+    def _dumps(self, data, *, stream=False):
+        # With stream=True, indented output of the json module is returned as an iterator of bytes blocks instead of
+        # a whole bytes object to spare memory. Compact output is not streamed as only one-shot encoding is done in C,
+        # neither is the output of custom encoders which override encode().
+        encoder = self._encoder
+        if stream and encoder.indent is not None and type(encoder).encode is json.JSONEncoder.encode:
+            return self._iterblocks(encoder.iterencode(data))
+        return encoder.encode(data).encode("utf8")
+
+    @staticmethod
+    def _iterblocks(chunks):
+        # joins the tiny chunks of JSONEncoder.iterencode() to fewer writes
+        blocks, size = [], 0
+        for chunk in chunks:
+            blocks.append(chunk)
+            size += len(chunk)
+            if _stream_block_size <= size:
+                yield "".join(blocks).encode("utf8")
+                blocks, size = [], 0
+        if blocks:
+            yield "".join(blocks).encode("utf8")
+
+    def _loads(self, b):
+        orjson = _import_orjson() if not any(self._load_kwargs.values()) else False
+        if orjson:
+            try:
+                return orjson.loads(b)
+            except orjson.JSONDecodeError:
+                pass  # e.g. NaN or too large integer; let the json module try
+        return self._decoder.decode(b.decode("utf8"))
+
+    @staticmethod
+    def _file_state(p, digest):
+        # the file stats make sure that deleted or externally modified files are rewritten
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            return None
+        return (p, digest, st.st_mtime_ns, st.st_size)
+
+    def _save_on_timer(self):
+        with self._lock:
+            if self._save_timer is threading.current_thread():  # not canceled or replaced while waiting for the lock
+                self._save(True)
+
+    def _changed(self, *, appended=False):
+        if not appended:
+            self._append_only_valid = False
+        if not self.autosave or self._suspend_autosave:
+            return
+        if self.autosave_delay is None:
+            self.save()
+            return
+        self._cancel_save_timer()
+        self._save_timer = threading.Timer(self.autosave_delay, self._save_on_timer)
+        self._save_timer.daemon = True
+        _pending_saves.add(self)
+        self._save_timer.start()
 
 
 
 class JSONFileContainer(JSONFileBase):
 
-    _methods_which_cause_change = ()
+    __slots__ = ("_jsonfile", "_data")
 
     def __init__(self, jsonfile, data):
         self._jsonfile = jsonfile
@@ -161,9 +505,9 @@ class JSONFileContainer(JSONFileBase):
         return self._data.__contains__(key)
 
     def __delitem__(self, key):
-        self._data.__delitem__(key)
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
+        with self._jsonfile._lock:
+            self._data.__delitem__(key)
+            self._jsonfile._changed()
 
     def __dir__(self):
         return sorted(self._data.__dir__() + ["jsonfile"])
@@ -192,26 +536,28 @@ class JSONFileContainer(JSONFileBase):
         return self._data.__repr__()
 
     def __setitem__(self, key, value):
-        self._data.__setitem__(key, value)
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
+        with self._jsonfile._lock:
+            self._data.__setitem__(key, value)
+            self._jsonfile._changed()
 
     def __sizeof__(self):
         # TODO(adam): not sure about this
         return object.__sizeof__(self) + self._data.__sizeof__()
 
     def clear(self):
-        self._data.clear()
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
+        with self._jsonfile._lock:
+            self._data.clear()
+            self._jsonfile._changed()
 
     def copy(self):
         """a deep copy of the internal data"""
-        return copy.deepcopy(self._data)
+        return self._inputvalue(self._data)  # rebuilds the containers; much cheaper than copy.deepcopy()
 
 
 
-class JSONFileArray(JSONFileContainer, list):
+class JSONFileArray(JSONFileContainer):
+
+    __slots__ = ()
 
     def __add__(self, value):
         raise AttributeError(
@@ -235,17 +581,21 @@ class JSONFileArray(JSONFileContainer, list):
         return self._data.__gt__(other if not hasattr(other, "_data") else other._data)
 
     def __iadd__(self, other):
-        self._data += self._inputvalue(other)
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
+        with self._jsonfile._lock:
+            self._data += self._inputvalue(other)
+            self._jsonfile._changed(appended=self._data is self._jsonfile._data)
+        return self
 
     def __imul__(self, other):
-        self._data *= self._inputvalue(other)
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
+        with self._jsonfile._lock:
+            self._data *= self._inputvalue(other)
+            self._jsonfile._changed()
+        return self
 
     def __iter__(self):
-        return JSONFileArray_iterator(self)
+        outputvalue = self._outputvalue
+        for v in self._data:
+            yield v if type(v) in _scalar_types else outputvalue(v)
 
     def __le__(self, other):
         return self._data.__le__(other if not hasattr(other, "_data") else other._data)
@@ -262,7 +612,9 @@ class JSONFileArray(JSONFileContainer, list):
         )
 
     def __reversed__(self):
-        return JSONFileArray_reverseiterator(self)
+        outputvalue = self._outputvalue
+        for v in reversed(self._data):
+            yield v if type(v) in _scalar_types else outputvalue(v)
 
     def __rmul__(self, value):
         raise AttributeError(
@@ -273,86 +625,52 @@ class JSONFileArray(JSONFileContainer, list):
         )
 
     def append(self, item):
-        self._data.append(self._inputvalue(item))
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
+        with self._jsonfile._lock:
+            self._data.append(self._inputvalue(item))
+            self._jsonfile._changed(appended=self._data is self._jsonfile._data)
 
     def count(self, value):
         return self._data.count(value)
 
     def extend(self, iterable):
-        self._data.extend(self._inputvalue(x) for x in iterable)
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
+        with self._jsonfile._lock:
+            self._data.extend(self._inputvalue(x) for x in iterable)
+            self._jsonfile._changed(appended=self._data is self._jsonfile._data)
 
     def index(self, value, start=0, stop=9223372036854775807):
         return self._data.index(value, start, stop)
 
     def insert(self, i, elem):
-        self._data.insert(i, self._inputvalue(elem))
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
+        with self._jsonfile._lock:
+            self._data.insert(i, self._inputvalue(elem))
+            self._jsonfile._changed()
 
     def pop(self, index=-1):
-        returnobj = self._data.pop(index)
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
-        return returnobj
+        with self._jsonfile._lock:
+            returnobj = self._data.pop(index)
+            self._jsonfile._changed()
+            return returnobj
 
     def remove(self, value):
-        self._data.remove(value)
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
+        with self._jsonfile._lock:
+            self._data.remove(value)
+            self._jsonfile._changed()
 
     def reverse(self):
-        self._data.reverse()
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
+        with self._jsonfile._lock:
+            self._data.reverse()
+            self._jsonfile._changed()
 
     def sort(self):
-        self._data.sort()
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
-
-
+        with self._jsonfile._lock:
+            self._data.sort()
+            self._jsonfile._changed()
 
-class JSONFileArray_iterator():
 
-    def __init__(self, obj):
-        self._obj = obj
-        self._i = 0
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        if self._i == len(self._obj):
-            raise StopIteration
-        returnobj = self._obj[self._i]
-        self._i += 1
-        return returnobj
 
+class JSONFileObject(JSONFileContainer):
 
-
-class JSONFileArray_reverseiterator():
-
-    def __init__(self, obj):
-        self._obj = obj
-        self._i = -1
-
-    def __iter__(self):
-        return self
-
-    def __next__(self):
-        if len(self._obj) < -self._i:
-            raise StopIteration
-        returnobj = self._obj[self._i]
-        self._i -= 1
-        return returnobj
-
-
-
-class JSONFileObject(JSONFileContainer, dict):
+    __slots__ = ()
 
     def __dir__(self):
         names = set(super().__dir__())
@@ -385,23 +703,24 @@ class JSONFileObject(JSONFileContainer, dict):
             return default
 
     def items(self):
-        for k in self:
-            yield k, self[k]
+        outputvalue = self._outputvalue
+        for k, v in self._data.items():
+            yield k, (v if type(v) in _scalar_types else outputvalue(v))
 
     def keys(self):
         return self._data.keys()
 
     def pop(self, key, default):
-        returnobj = self._data.pop(key, default)
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
-        return returnobj
+        with self._jsonfile._lock:
+            returnobj = self._data.pop(key, default)
+            self._jsonfile._changed()
+            return returnobj
 
     def popitem(self):
-        returnobj = self._data.popitem()
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
-        return returnobj
+        with self._jsonfile._lock:
+            returnobj = self._data.popitem()
+            self._jsonfile._changed()
+            return returnobj
 
     def setdefault(self, key, default):
         try:
@@ -411,15 +730,31 @@ class JSONFileObject(JSONFileContainer, dict):
         return self[key]
 
     def update(self, *args, **kwargs):
-        _args = [self._inputvalue(x) for x in args]
-        _kwargs = {k: self._inputvalue(v) for k, v in kwargs.items()}
-        self._data.update(*_args, **_kwargs)
-        if self._jsonfile.autosave:
-            self._jsonfile.save()
+        with self._jsonfile._lock:
+            _args = [self._inputvalue(x) for x in args]
+            _kwargs = {k: self._inputvalue(v) for k, v in kwargs.items()}
+            self._data.update(*_args, **_kwargs)
+            self._jsonfile._changed()
 
     def values(self):
-        for key in self:
-            yield self[key]
+        outputvalue = self._outputvalue
+        for v in self._data.values():
+            yield v if type(v) in _scalar_types else outputvalue(v)
+
+
+
+# adapters only wrap the internal data but they should still pass as containers
+collections.abc.MutableSequence.register(JSONFileArray)
+collections.abc.MutableMapping.register(JSONFileObject)
+
+
+
+_pending_saves = weakref.WeakSet()
+
+@atexit.register
+def _flush_pending_saves():
+    for jf in list(_pending_saves):
+        jf.flush()
 
 
 
@@ -0,0 +1,248 @@
+import dataclasses
+import json
+import pathlib
+import tempfile
+import time
+import typing
+import unittest
+
+import jsonfile
+
+
+
+class User(typing.TypedDict):
+    name: str
+    age: int
+    tags: list[str]
+    scores: typing.Optional[dict[str, list[float]]]
+
+
+@dataclasses.dataclass
+class Document:
+    users: list[User]
+    owner: User | None
+    extra: dict
+
+
+class Node(typing.TypedDict):
+    name: str
+    children: list["Node"]
+
+
+
+class TestAppendOnly(unittest.TestCase):
+
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.path = pathlib.Path(tempdir.name) / "a.json"
+
+    def test_matches_full_save(self):
+        for dump_kwargs in (
+            None,
+            {"ensure_ascii": True},
+            {"sort_keys": True},
+            {"indent": 0},
+            {"indent": 2, "separators": (", ", ": ")},
+            {"separators": (",", ":")},
+        ):
+            with self.subTest(dump_kwargs=dump_kwargs):
+                a = jsonfile.jsonfile(self.path, data=[1, 2], append_only=True, dump_kwargs=dump_kwargs)
+                a.data.append(3)
+                a.data.extend(["é", {"x": [1]}])
+                expected = [1, 2, 3, "é", {"x": [1]}]
+                kwargs = a.default_dump_kwargs if dump_kwargs is None else dump_kwargs
+                self.assertEqual(self.path.read_text(encoding="utf8"), json.dumps(expected, **kwargs))
+                self.assertEqual(jsonfile.jsonfile(self.path).data, expected)
+
+    def test_falls_back_to_full_save(self):
+        a = jsonfile.jsonfile(self.path, data=[{"a": 1}], append_only=True)
+        a.data.append(2)
+        a.data[0]["a"] = 3  # not an append to the root array
+        a.data.append(4)
+        self.assertEqual(jsonfile.jsonfile(self.path).data, [{"a": 3}, 2, 4])
+        self.path.write_text("[1]")  # modified by others
+        a.data.append(5)
+        self.assertEqual(jsonfile.jsonfile(self.path).data, [{"a": 3}, 2, 4, 5])
+
+    def test_inplace_add(self):
+        a = jsonfile.jsonfile(self.path, data=[1, 2], append_only=True)
+        inode = self.path.stat().st_ino
+        a.data += [3, 4]
+        self.assertEqual(jsonfile.jsonfile(self.path).data, [1, 2, 3, 4])
+        self.assertEqual(self.path.stat().st_ino, inode)  # appended in place, not replaced
+        a.data *= 2
+        self.assertEqual(jsonfile.jsonfile(self.path).data, [1, 2, 3, 4] * 2)
+
+    def test_dump_kwargs_change_falls_back_to_full_save(self):
+        a = jsonfile.jsonfile(self.path, data=[1, 2], append_only=True, dump_kwargs={})
+        a.dump_kwargs = a.default_dump_kwargs
+        a.data.append(3)
+        self.assertEqual(self.path.read_text(encoding="utf8"), json.dumps([1, 2, 3], **a.default_dump_kwargs))
+
+    def test_path_change_falls_back_to_full_save(self):
+        a = jsonfile.jsonfile(self.path, data=[1, 2], append_only=True)
+        other = self.path.with_name("b.json")
+        other.write_text(self.path.read_text())
+        a.path = other
+        a.data.append(3)
+        self.assertEqual(jsonfile.jsonfile(other).data, [1, 2, 3])
+
+
+
+class TestJSONFileRoot(unittest.TestCase):
+
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.path = pathlib.Path(tempdir.name) / "a.json"
+
+    def test_custom_encode(self):
+        class Encoder(json.JSONEncoder):
+            def encode(self, o):
+                return super().encode(o).upper()
+        jsonfile.jsonfile(self.path, data=["a"], dump_kwargs={"cls": Encoder, "indent": 1})
+        self.assertEqual(self.path.read_text(), '[\n "A"\n]')
+
+    def test_unchanged_save_keeps_file(self):
+        a = jsonfile.jsonfile(self.path, data={"a": [1]}, durability="safe")
+        inode = self.path.stat().st_ino
+        a.data["a"] = [1]
+        a.save()
+        self.assertEqual(self.path.stat().st_ino, inode)
+        self.assertEqual([p.name for p in self.path.parent.iterdir()], ["a.json"])  # no temporary file left
+        a.data["a"] = [2]
+        self.assertNotEqual(self.path.stat().st_ino, inode)
+
+    def test_invalid_durability(self):
+        with self.assertRaises(ValueError):
+            jsonfile.jsonfile(self.path, durability="sfae")
+        a = jsonfile.jsonfile(self.path, durability="safe")
+        with self.assertRaises(ValueError):
+            a.durability = "sfae"
+        self.assertEqual(a.durability, "safe")
+
+
+
+class TestDelayedSave(unittest.TestCase):
+
+    def setUp(self):
+        tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tempdir.cleanup)
+        self.path = pathlib.Path(tempdir.name) / "a.json"
+
+    def test_batch(self):
+        a = jsonfile.jsonfile(self.path, data=[])
+        with a.batch():
+            a.data.append(1)
+            with a.batch():
+                a.data.append(2)
+            self.assertEqual(jsonfile.jsonfile(self.path).data, [])  # nested block does not save
+        self.assertEqual(jsonfile.jsonfile(self.path).data, [1, 2])
+
+    def test_delay(self):
+        a = jsonfile.jsonfile(self.path, data=[], autosave_delay=0.05)
+        a.data.append(1)
+        self.assertEqual(jsonfile.jsonfile(self.path).data, [])
+        time.sleep(0.2)
+        self.assertEqual(jsonfile.jsonfile(self.path).data, [1])
+
+    def test_flush(self):
+        a = jsonfile.jsonfile(self.path, data=[], autosave_delay=60)
+        a.data.append(1)
+        a.flush()
+        self.assertEqual(jsonfile.jsonfile(self.path).data, [1])
+        self.assertIsNone(a._save_timer)
+
+    def test_delete_cancels_delayed_save(self):
+        a = jsonfile.jsonfile(self.path, data=[], autosave_delay=0.05)
+        a.data.append(1)
+        a.delete()
+        time.sleep(0.2)
+        self.assertFalse(self.path.exists())
+        a.flush()  # as at exit
+        self.assertFalse(self.path.exists())
+
+    def test_delayed_save_waits_for_lock(self):
+        a = jsonfile.jsonfile(self.path, data=[], autosave_delay=0.01)
+        with a._lock:  # as a change in progress on this thread
+            a.data.append(1)
+            timer = a._save_timer
+            time.sleep(0.1)
+            self.assertEqual(jsonfile.jsonfile(self.path).data, [])
+        timer.join()
+        self.assertEqual(jsonfile.jsonfile(self.path).data, [1])
+
+    def test_replaced_timer_does_not_save(self):
+        a = jsonfile.jsonfile(self.path, data=[], autosave_delay=0.01)
+        with a._lock:
+            a.data.append(1)
+            timer = a._save_timer
+            time.sleep(0.05)  # timer fired and waits for the lock
+            a.autosave_delay = 60
+            a.data.append(2)  # replaces the timer
+        timer.join()
+        self.assertEqual(jsonfile.jsonfile(self.path).data, [])
+        a.flush()
+        self.assertEqual(jsonfile.jsonfile(self.path).data, [1, 2])
+
+
+
+class TestSchema(unittest.TestCase):
+
+    def assertSameAsGeneric(self, schema, value):
+        converted = jsonfile._compile_inputvalue(schema)(value)
+        self.assertEqual(converted, jsonfile._inputvalue(value))
+        self.assertEqual(json.dumps(converted), json.dumps(jsonfile._inputvalue(value)))  # also key types and order
+        return converted
+
+    def test_nested(self):
+        user = {"name": "a", "age": 1, "tags": ("x", "y"), "scores": {"q": (1.5, 2)}, 5: {1: 2}}
+        document = {
+            "users": [user, {"name": "b", "age": 2, "tags": [], "scores": None}],
+            "owner": user,
+            "extra": {1: [2]},
+            "z": (1,),
+        }
+        converted = self.assertSameAsGeneric(Document, document)
+        self.assertIsNot(converted["owner"], user)  # copied, not stored
+
+    def test_optional(self):
+        for schema in (typing.Optional[list[int]], list[int] | None):
+            with self.subTest(schema=schema):
+                self.assertSameAsGeneric(schema, None)
+                self.assertSameAsGeneric(schema, (1, 2))
+
+    def test_recursive(self):
+        tree = {"name": "a", "children": [{"name": "b", "children": [{"name": "c", "children": ()}]}]}
+        self.assertSameAsGeneric(Node, tree)
+
+    def test_non_str_keys(self):
+        self.assertSameAsGeneric(dict[str, int], {1: 1, True: 2, None: 3})
+        self.assertSameAsGeneric(User, {1: "x", "name": "a"})
+
+    def test_mismatch(self):
+        for schema, value in (
+            (list[User], {"x": 1}),
+            (list[str], {"a": [1]}),
+            (User, ["name", "a"]),
+            (dict[str, int], [1, 2]),
+            (int, {"a": (1,)}),
+            (Node, {"name": 1, "children": {"a": 2}}),
+        ):
+            with self.subTest(schema=schema, value=value):
+                self.assertSameAsGeneric(schema, value)
+
+    def test_data_assignment(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            path = pathlib.Path(tempdir) / "a.json"
+            a = jsonfile.jsonfile(path, data=[], schema=list[User])
+            a.data = [{"name": "a", "age": 1, "tags": ("x",), "scores": None}]
+            self.assertEqual(jsonfile.jsonfile(path).data, [{"name": "a", "age": 1, "tags": ["x"], "scores": None}])
+            a.data = {"x": 1}
+            self.assertEqual(jsonfile.jsonfile(path).data, {"x": 1})
+
+
+
+if __name__ == "__main__":
+    unittest.main()